@@ -1,13 +1,24 @@
 
 from __future__ import annotations
 import os
+import sqlite3
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 from typing import List, Dict, Any
 
+import bcrypt
+import click
 from flask import Flask, render_template, request, redirect, url_for, flash, session, abort
 from flask_sqlalchemy import SQLAlchemy
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import bindparam, event, inspect, lambda_stmt, or_, select, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import defer
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash
 
 # -----------------------------
 # App + Config
@@ -16,12 +27,63 @@ app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev_secret_key_change_me")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///ecofinds.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    # Room for every route's compiled statements (default is 500)
+    "query_cache_size": 1200,
+}
+_db_url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+_pool_sizing = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+}
+if _db_url.get_backend_name() == "sqlite":
+    # Pooled connections are handed to whichever request thread checks them out
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {"check_same_thread": False}
+    # In-memory databases get a StaticPool, which takes no sizing arguments
+    if _db_url.database not in (None, "", ":memory:"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"].update(_pool_sizing)
+else:
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update(_pool_sizing, pool_pre_ping=True, pool_recycle=1800)
+app.config["BCRYPT_ROUNDS"] = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Use a shared backend (e.g. redis://) when running several worker processes
+app.config["RATELIMIT_STORAGE_URI"] = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
+app.config["AUTH_RATE_LIMIT"] = os.getenv("AUTH_RATE_LIMIT", "10 per minute")
+# Behind nginx/a CDN every request comes from the proxy's address, which would
+# put all clients in one rate-limit bucket. Set PROXY_HOPS to the number of
+# trusted proxies so remote_addr is taken from X-Forwarded-For instead.
+_proxy_hops = int(os.getenv("PROXY_HOPS", "0"))
+if _proxy_hops:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=_proxy_hops, x_proto=_proxy_hops)
+
+# Compiled templates are cached on disk so workers don't re-parse them.
+# init-db creates the directory; without it templates compile in memory.
+_jinja_cache_dir = os.path.join(app.instance_path, "jinja_cache")
+if os.path.isdir(_jinja_cache_dir):
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(_jinja_cache_dir)
 
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
+limiter = Limiter(get_remote_address, app=app)
+
+# WAL + synchronous=NORMAL so commits don't fsync the rollback journal
+# and readers don't block on writers.
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.execute("PRAGMA cache_size=-65536")
+    cur.close()
 
 CATEGORIES = ["Home", "Fashion", "Electronics", "Outdoors", "Beauty", "Other"]
+CATEGORY_SET = frozenset(CATEGORIES)
+MAX_PASSWORD_BYTES = 72  # bcrypt input limit
+MAX_PRICE_CENTS = 10_000_000_000  # $100M; keeps order totals well inside SQLite INTEGER
 
 # -----------------------------
 # Models
@@ -35,38 +97,73 @@ class User(UserMixin, db.Model):
     orders = db.relationship("Order", backref="buyer", lazy=True)
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        salt = bcrypt.gensalt(rounds=app.config["BCRYPT_ROUNDS"])
+        self.password_hash = bcrypt.hashpw(password.encode(), salt).decode()
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash.startswith("$2"):
+            # Accounts created before the switch to bcrypt
+            return check_password_hash(self.password_hash, password)
+        pw = password.encode()
+        return len(pw) <= MAX_PASSWORD_BYTES and bcrypt.checkpw(pw, self.password_hash.encode())
 
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text, default="")
-    price = db.Column(db.Float, nullable=False, default=0.0)
-    category = db.Column(db.String(50), default="Other")
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    price_cents = db.Column(db.Integer, nullable=False, default=0)
+    category = db.Column(db.String(50), default="Other", index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     seller_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
+    __table_args__ = (db.Index("ix_product_seller_created", "seller_id", "created_at"),)
+
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    total = db.Column(db.Float, nullable=False, default=0.0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    total_cents = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     items = db.relationship("OrderItem", backref="order", lazy=True)
 
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
-    price = db.Column(db.Float, nullable=False, default=0.0)
+    price_cents = db.Column(db.Integer, nullable=False, default=0)
     product = db.relationship("Product")
 
+# Full-text search over Product (external-content FTS5 table kept in
+# sync by triggers). SQLite only; other backends fall back to ILIKE.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description, content='product', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+def create_search_index() -> None:
+    if db.engine.dialect.name != "sqlite":
+        return
+    with db.engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")).first()
+        for ddl in SEARCH_INDEX_DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            # Backfill rows that were inserted before the triggers existed
+            conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
 # -----------------------------
 # Auth helpers
 # -----------------------------
@@ -74,11 +171,44 @@ class OrderItem(db.Model):
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
-# Create tables at startup (Flask 3.x-safe)
-with app.app_context():
-    db.create_all()
+# -----------------------------
+# Database setup
+# -----------------------------
+# (table, old Float column, integer-cents column) for databases created
+# before prices were stored in cents
+PRICE_COLUMN_UPGRADES = [
+    ("product", "price", "price_cents"),
+    ("order", "total", "total_cents"),
+    ("order_item", "price", "price_cents"),
+]
+
+def upgrade_price_columns() -> None:
+    with db.engine.begin() as conn:
+        inspector = inspect(conn)
+        for table, old, new in PRICE_COLUMN_UPGRADES:
+            columns = {column["name"] for column in inspector.get_columns(table)}
+            if old not in columns:
+                continue
+            quoted = conn.dialect.identifier_preparer.quote(table)
+            if new not in columns:
+                conn.execute(text(f"ALTER TABLE {quoted} ADD COLUMN {new} INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text(f"UPDATE {quoted} SET {new} = CAST(ROUND({old} * 100) AS INTEGER)"))
+            # The old column is NOT NULL without a server default, so new rows would fail to insert
+            conn.execute(text(f"ALTER TABLE {quoted} DROP COLUMN {old}"))
+
+def init_db() -> None:
+    os.makedirs(_jinja_cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(_jinja_cache_dir)
 
-# Seed minimal data if empty
+    db.create_all()
+    upgrade_price_columns()
+    # create_all() skips indexes on tables that already exist
+    for model in (Product, Order, OrderItem):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    create_search_index()
+
+    # Seed minimal data if empty
     if not User.query.first():
         demo = User(email="demo@ecofinds.local", name="Demo User")
         demo.set_password("demo1234")
@@ -87,22 +217,64 @@ with app.app_context():
     if not Product.query.first():
         demo = User.query.first()
         seed = [
-            Product(name="Bamboo Toothbrush", description="Eco-friendly bamboo toothbrush.", price=3.99, category="Beauty", seller_id=demo.id),
-            Product(name="Reusable Water Bottle", description="Stainless steel bottle, 750ml.", price=14.50, category="Outdoors", seller_id=demo.id),
-            Product(name="Organic Cotton Tote", description="Durable tote bag for daily use.", price=9.99, category="Fashion", seller_id=demo.id),
+            Product(name="Bamboo Toothbrush", description="Eco-friendly bamboo toothbrush.", price_cents=399, category="Beauty", seller_id=demo.id),
+            Product(name="Reusable Water Bottle", description="Stainless steel bottle, 750ml.", price_cents=1450, category="Outdoors", seller_id=demo.id),
+            Product(name="Organic Cotton Tote", description="Durable tote bag for daily use.", price_cents=999, category="Fashion", seller_id=demo.id),
         ]
         db.session.add_all(seed)
         db.session.commit()
 
+# Run once per deploy (`flask --app app init-db`) rather than on every worker import
+@app.cli.command("init-db")
+def init_db_command() -> None:
+    """Create tables and the search index, and seed demo data."""
+    init_db()
+    click.echo("Initialized the database.")
+
 # -----------------------------
 # Utilities
 # -----------------------------
 def get_cart() -> List[Dict[str, Any]]:
-    return session.get("cart", [])
+    cart = session.get("cart", [])
+    # Carts saved before prices moved to integer cents store a float "price"
+    for item in cart:
+        if "price_cents" not in item:
+            item["price_cents"] = round(item.pop("price", 0) * 100)
+    return cart
 
 def save_cart(cart: List[Dict[str, Any]]) -> None:
     session["cart"] = cart
 
+def cart_total(cart: List[Dict[str, Any]]) -> int:
+    return sum(item["price_cents"] * item.get("quantity", 1) for item in cart)
+
+def parse_price_cents(value: str) -> int:
+    # Decimal avoids float rounding, e.g. "0.29" -> 29 rather than 28
+    cents = int((Decimal(value or "0") * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    if not 0 <= cents <= MAX_PRICE_CENTS:
+        raise ValueError(f"price out of range: {value!r}")
+    return cents
+
+@app.template_filter("cents")
+def format_cents(cents: int) -> str:
+    return f"{cents // 100}.{cents % 100:02d}"
+
+def fts_query(q: str) -> str:
+    # Quote each token so FTS5 operators in user input are matched literally;
+    # the trailing * keeps prefix matches like the old substring search.
+    return " ".join('"{}"*'.format(token.replace('"', '""')) for token in q.split())
+
+# Static assets can be cached by browsers/CDNs for a year without revalidation;
+# rename a file (e.g. logo.v2.svg) when its contents change.
+@app.after_request
+def cache_static(response):
+    if request.endpoint == "static" and response.status_code in (200, 304):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    return response
+
 # -----------------------------
 # Routes
 # -----------------------------
@@ -111,14 +283,23 @@ def index():
     q = request.args.get("q", "").strip()
     category = request.args.get("category", "").strip()
 
-    query = Product.query
+    # lambda_stmt caches the compiled SQL per branch; only the params vary
+    stmt = lambda_stmt(lambda: select(Product).order_by(Product.created_at.desc()))
+    params: Dict[str, Any] = {}
     if q:
-        like = f"%{q}%"
-        query = query.filter(db.or_(Product.name.ilike(like), Product.description.ilike(like)))
+        if db.engine.dialect.name == "sqlite":
+            params["ids"] = db.session.execute(
+                text("SELECT rowid FROM product_fts WHERE product_fts MATCH :q"), {"q": fts_query(q)}
+            ).scalars().all()
+            stmt += lambda s: s.where(Product.id.in_(bindparam("ids", expanding=True)))
+        else:
+            params["like"] = f"%{q}%"
+            stmt += lambda s: s.where(or_(Product.name.ilike(bindparam("like")), Product.description.ilike(bindparam("like"))))
     if category:
-        query = query.filter_by(category=category)
+        params["category"] = category
+        stmt += lambda s: s.where(Product.category == bindparam("category"))
 
-    products = query.order_by(Product.created_at.desc()).all()
+    products = db.session.execute(stmt, params).scalars().all()
     return render_template("index.html", products=products, q=q, category=category, categories=CATEGORIES)
 
 @app.route("/product/<int:product_id>")
@@ -132,12 +313,20 @@ def product_form():
     if request.method == "POST":
         name = request.form.get("name", "").strip()
         description = request.form.get("description", "").strip()
-        price = float(request.form.get("price") or 0)
+        price_raw = request.form.get("price", "").strip()
         category = request.form.get("category", "Other")
         if not name:
             flash("Product name is required.", "error")
             return redirect(url_for("product_form"))
-        p = Product(name=name, description=description, price=price, category=category, seller_id=current_user.id)
+        if category not in CATEGORY_SET:
+            flash("Please choose a valid category.", "error")
+            return redirect(url_for("product_form"))
+        try:
+            price_cents = parse_price_cents(price_raw)
+        except (ArithmeticError, ValueError):
+            flash("Please enter a valid price.", "error")
+            return redirect(url_for("product_form"))
+        p = Product(name=name, description=description, price_cents=price_cents, category=category, seller_id=current_user.id)
         db.session.add(p)
         db.session.commit()
         flash("Product created.", "success")
@@ -147,7 +336,12 @@ def product_form():
 @app.route("/my-listings")
 @login_required
 def my_listings():
-    listings = Product.query.filter_by(seller_id=current_user.id).order_by(Product.created_at.desc()).all()
+    listings = (
+        Product.query.options(defer(Product.description))
+        .filter_by(seller_id=current_user.id)
+        .order_by(Product.created_at.desc())
+        .all()
+    )
     return render_template("my_listings.html", listings=listings)
 
 @app.route("/dashboard")
@@ -160,6 +354,7 @@ def dashboard():
 
 # ------------- Auth -------------
 @app.route("/login", methods=["GET", "POST"])
+@limiter.limit(lambda: app.config["AUTH_RATE_LIMIT"], methods=["POST"])
 def login():
     if request.method == "POST":
         email = request.form.get("email", "").strip().lower()
@@ -174,6 +369,7 @@ def login():
     return render_template("login.html")
 
 @app.route("/signup", methods=["GET", "POST"])
+@limiter.limit(lambda: app.config["AUTH_RATE_LIMIT"], methods=["POST"])
 def signup():
     if request.method == "POST":
         name = request.form.get("name", "").strip()
@@ -182,6 +378,9 @@ def signup():
         if not name or not email or not password:
             flash("All fields are required.", "error")
             return redirect(url_for("signup"))
+        if len(password.encode()) > MAX_PASSWORD_BYTES:
+            flash("Password is too long.", "error")
+            return redirect(url_for("signup"))
         if User.query.filter_by(email=email).first():
             flash("Email already registered.", "error")
             return redirect(url_for("signup"))
@@ -205,7 +404,7 @@ def logout():
 @app.route("/cart")
 def cart():
     cart_items = get_cart()
-    total = sum(item["price"] * item.get("quantity", 1) for item in cart_items)
+    total = cart_total(cart_items)
     return render_template("cart.html", cart_items=cart_items, total=total)
 
 @app.route("/cart/add/<int:product_id>", methods=["POST", "GET"])
@@ -218,7 +417,7 @@ def add_to_cart(product_id: int):
             item["quantity"] = item.get("quantity", 1) + 1
             break
     else:
-        cart.append({"id": product.id, "name": product.name, "price": product.price, "quantity": 1})
+        cart.append({"id": product.id, "name": product.name, "price_cents": product.price_cents, "quantity": 1})
     save_cart(cart)
     flash("Added to cart.", "success")
     return redirect(url_for("cart"))
@@ -238,12 +437,14 @@ def checkout():
     if not cart:
         flash("Your cart is empty.", "error")
         return redirect(url_for("cart"))
-    total = sum(item["price"] * item.get("quantity", 1) for item in cart)
-    order = Order(user_id=current_user.id, total=total)
+    total = cart_total(cart)
+    order = Order(user_id=current_user.id, total_cents=total)
     db.session.add(order)
     db.session.flush()  # get order.id
-    for item in cart:
-        db.session.add(OrderItem(order_id=order.id, product_id=item["id"], quantity=item.get("quantity",1), price=item["price"]))
+    db.session.execute(OrderItem.__table__.insert(), [
+        {"order_id": order.id, "product_id": item["id"], "quantity": item.get("quantity", 1), "price_cents": item["price_cents"]}
+        for item in cart
+    ])
     db.session.commit()
     save_cart([])
     flash(f"Order #{order.id} placed successfully!", "success")
@@ -259,4 +460,6 @@ def orders():
 # Run
 # -----------------------------
 if __name__ == "__main__":
+    with app.app_context():
+        init_db()
     app.run(debug=True)